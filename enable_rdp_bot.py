@@ -18,22 +18,17 @@ Auto-fix capabilities:
 """
 
 import argparse
+import functools
+import hashlib
 import json
 import logging
 import os
+import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Any
-
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.network import NetworkManagementClient
-from azure.mgmt.resource import ResourceManagementClient
-import openai
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from typing import Any, Callable, Dict, List, Optional
 
 # Configure logging (minimal output)
 logging.basicConfig(
@@ -42,6 +37,334 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Third-party loggers that trace every HTTP request (azure-core logs request and
+# response headers at INFO); muted to warnings unless --debug-http is given
+HTTP_LOGGERS = ('azure', 'urllib3', 'openai', 'httpx')
+for _name in HTTP_LOGGERS:
+    logging.getLogger(_name).setLevel(logging.WARNING)
+
+# Destination port matched when scanning NSG rules for RDP
+RDP_PORT = '3389'
+
+# Source address prefixes that match traffic from any client
+OPEN_SOURCE_PREFIXES = {'*', 'Internet', 'Any', '0.0.0.0/0'}
+
+# Upper bound on concurrent Azure read calls issued by one troubleshooter
+MAX_WORKERS = 8
+
+# Connections kept per host in the shared ARM connection pool; above the requests
+# default of 10 so the concurrent reads plus an overlapping fix never queue for one
+HTTP_POOL_MAXSIZE = 20
+
+# How long a fetched VM/NIC/NSG object is reused before it is read from ARM again
+ARM_CACHE_TTL_SECONDS = 60
+
+# Retry tuning for ARM calls. azure-core retries throttled (429) and 5xx responses
+# up to retry_status times (default 3). A Retry-After header is slept as-is;
+# otherwise it backs off exponentially without jitter (0, 2, 4, 8, 16s here)
+ARM_RETRY_STATUS = 5
+ARM_RETRY_BACKOFF_FACTOR = 1.0
+
+# Seconds between status polls of long-running ARM operations (VM start, NSG rule
+# changes) when the service sends no Retry-After; the SDK default is 30s, while
+# these operations usually finish within a few seconds
+LRO_POLLING_INTERVAL = 2
+
+# Retries for OpenAI calls; the SDK applies jittered exponential backoff and
+# honors Retry-After on 429s
+OPENAI_MAX_RETRIES = 4
+
+# On-disk cache for data that outlives a single run (e.g. the OpenAI model list)
+CACHE_DIR = os.path.join(
+    os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'enable_rdp_bot'
+)
+
+# How long the cached OpenAI model list is trusted before /v1/models is queried again
+MODELS_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# How long a cached AI analysis is reused for identical VM and NSG state
+AI_CACHE_TTL_SECONDS = 60 * 60
+
+# vm_status fields sent to the AI model; the rest do not affect RDP diagnosis
+AI_VM_STATUS_FIELDS = ('power_state', 'provisioning_state', 'os_type', 'vm_size')
+
+# nsg_info fields sent to the AI model, at the top level, per NSG on the RDP
+# path and per inbound RDP rule; priorities are already folded into the flags
+AI_NSG_INFO_FIELDS = ('rdp_allowed', 'rdp_conflict', 'rdp_open', 'has_deny_rdp', 'error')
+AI_NSG_FIELDS = ('name', 'attached_to', 'rdp_allowed', 'rdp_conflict', 'rdp_open')
+AI_NSG_RULE_FIELDS = ('nsg', 'name', 'access', 'priority', 'protocol', 'source')
+
+# Static fields of the AllowRDP rule managed by the bot; only the priority
+# varies per run and is filled in by fix_nsg_rdp_rule
+RDP_ALLOW_RULE_TEMPLATE = {
+    'name': 'AllowRDP',
+    'direction': 'Inbound',
+    'access': 'Allow',
+    'protocol': 'Tcp',
+    'source_port_range': '*',
+    'destination_port_range': RDP_PORT,
+    'source_address_prefix': '*',
+    'destination_address_prefix': '*',
+    'description': 'Allow RDP access - Managed by Enable RDP Bot'
+}
+
+# Prompts for analyze_with_ai; the user prompt is filled with str.format, so
+# literal braces in the JSON example are doubled
+AI_SYSTEM_PROMPT = "You are an expert Azure RDP troubleshooting specialist. Provide clear, actionable recommendations in JSON format."
+
+AI_ANALYSIS_PROMPT = """
+You are an Azure RDP troubleshooting expert. Analyze the following VM and network configuration to diagnose RDP connectivity issues.
+
+VM Status: {vm_status}
+Network Security Group Info: {nsg_info}
+Additional Info: {additional_info}
+
+Please provide:
+1. Root cause analysis
+2. Specific steps to fix the issue
+3. Prevention recommendations
+4. Priority level (High/Medium/Low)
+
+Format your response as JSON with the following structure:
+{{
+    "root_cause": "Brief description of the issue",
+    "fix_steps": ["Step 1", "Step 2", "Step 3"],
+    "prevention": ["Recommendation 1", "Recommendation 2"],
+    "priority": "High/Medium/Low",
+    "confidence": 0.95
+}}
+"""
+
+def _load_cache(path: str, ttl: int) -> Optional[Any]:
+    """
+    Read a JSON cache entry if it exists and is younger than ttl
+    
+    Args:
+        path (str): Cache file path
+        ttl (int): Maximum cache age in seconds
+        
+    Returns:
+        Optional[Any]: Cached data, or None on miss, expiry or a corrupt file
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if time.time() - cached['fetched_at'] < ttl:
+            return cached['data']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+def _store_cache(path: str, data: Any) -> None:
+    """
+    Atomically write a JSON cache entry
+    
+    The entry is written to a temporary file and renamed into place, so a
+    concurrent run never reads a partially written cache.
+    
+    Args:
+        path (str): Cache file path
+        data (Any): JSON-serializable data to cache
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': time.time(), 'data': data}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # Caching is an optimization only; never fail the run over it
+        logger.debug("Could not write cache %s: %s", path, e)
+
+def _compact_vm_status(vm_status: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Project VM status down to the fields relevant for RDP diagnosis
+    
+    Names, location and full NIC resource IDs cost prompt tokens without
+    changing the analysis.
+    
+    Args:
+        vm_status (Dict[str, Any]): Result of get_vm_status
+        
+    Returns:
+        Dict[str, Any]: Compact VM status for the AI prompt
+    """
+    return {key: vm_status[key] for key in AI_VM_STATUS_FIELDS if key in vm_status}
+
+def _compact_nsg_info(nsg_info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Project the NSG analysis down to what the AI model needs for RDP diagnosis
+    
+    Only NSGs on the primary NIC's RDP path and their inbound RDP rules are
+    kept; NSGs on secondary NICs, raw priorities and unset fields are dropped.
+    
+    Args:
+        nsg_info (Dict[str, Any]): Result of check_nsg_rules
+        
+    Returns:
+        Dict[str, Any]: Compact NSG analysis for the AI prompt
+    """
+    compact = {
+        key: nsg_info[key] for key in AI_NSG_INFO_FIELDS
+        if nsg_info.get(key) is not None
+    }
+    path_nsgs = [nsg for nsg in nsg_info.get('nsgs', []) if nsg.get('on_rdp_path')]
+    path_nsg_names = {nsg['name'] for nsg in path_nsgs}
+    if path_nsgs:
+        compact['nsgs'] = [{key: nsg[key] for key in AI_NSG_FIELDS if key in nsg} for nsg in path_nsgs]
+    rules = [
+        {key: rule[key] for key in AI_NSG_RULE_FIELDS if rule.get(key) is not None}
+        for rule in nsg_info.get('rules', [])
+        if rule.get('direction') == 'Inbound' and rule.get('nsg') in path_nsg_names
+    ]
+    if rules:
+        compact['rules'] = rules
+    if nsg_info.get('subnet_errors'):
+        compact['unreadable_subnets'] = [error['subnet'] for error in nsg_info['subnet_errors']]
+    return compact
+
+@functools.lru_cache(maxsize=None)
+def parse_arm_id(resource_id: str) -> Dict[str, Any]:
+    """
+    Parse an ARM resource ID into its components, memoized per ID
+    
+    The same NIC and NSG IDs are looked up by check_nsg_rules and
+    fix_nsg_rdp_rule, so each distinct ID is parsed only once. Callers must
+    not modify the returned dict.
+    
+    Args:
+        resource_id (str): Full ARM resource ID
+        
+    Returns:
+        Dict[str, Any]: Components as returned by azure.mgmt.core.tools.parse_resource_id
+            (resource_group, name, child_name_1, resource_name, ...)
+    """
+    from azure.mgmt.core.tools import parse_resource_id
+    return parse_resource_id(resource_id)
+
+def resource_name(resource_id: str) -> str:
+    """
+    Extract the resource name from an ARM resource ID
+    
+    Args:
+        resource_id (str): Full ARM resource ID
+        
+    Returns:
+        str: Name of the resource (of the last child for child resources)
+    """
+    return parse_arm_id(resource_id)['resource_name']
+
+def resource_group_name(resource_id: str) -> str:
+    """
+    Extract the resource group name from an ARM resource ID
+    
+    Args:
+        resource_id (str): Full ARM resource ID (/subscriptions/<id>/resourceGroups/<rg>/...)
+        
+    Returns:
+        str: Name of the resource group containing the resource
+    """
+    return parse_arm_id(resource_id)['resource_group']
+
+def is_rdp_rule(rule: Any) -> bool:
+    """
+    Check whether an NSG security rule targets the RDP port
+    
+    A rule carries either a single destination_port_range or a list in
+    destination_port_ranges; both are folded into one set for a single lookup.
+    
+    Args:
+        rule (Any): NSG security rule model
+        
+    Returns:
+        bool: True if the rule's destination ports include 3389
+    """
+    ports = {getattr(rule, 'destination_port_range', None)}
+    ports.update(getattr(rule, 'destination_port_ranges', None) or ())
+    return RDP_PORT in ports
+
+def get_subscription_id() -> Optional[str]:
+    """
+    Determine the Azure subscription ID without starting the Azure CLI when possible
+    
+    Lookup order:
+    1. AZURE_SUBSCRIPTION_ID environment variable
+    2. Default subscription in the Azure CLI profile (azureProfile.json under
+       $AZURE_CONFIG_DIR or ~/.azure), as set by 'az login' / 'az account set'
+    3. 'az account show' (slow: starts a separate Python process)
+    
+    Returns:
+        Optional[str]: Subscription ID, or None if it could not be determined
+    """
+    subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
+    if subscription_id:
+        return subscription_id
+    
+    config_dir = os.getenv('AZURE_CONFIG_DIR') or os.path.join(os.path.expanduser('~'), '.azure')
+    try:
+        # The Azure CLI writes this file with a UTF-8 byte order mark
+        with open(os.path.join(config_dir, 'azureProfile.json'), 'r', encoding='utf-8-sig') as f:
+            profile = json.load(f)
+        for subscription in profile.get('subscriptions', []):
+            if subscription.get('isDefault'):
+                return subscription['id']
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    
+    # Only a missing az binary or a failing az command mean "not logged in";
+    # anything else (e.g. KeyboardInterrupt) should propagate
+    try:
+        result = subprocess.run(['az', 'account', 'show', '--query', 'id', '-o', 'tsv'],
+                              capture_output=True, text=True, check=True)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def primary_nic_id(vm: Any) -> str:
+    """
+    Get the resource ID of a VM's primary network interface
+    
+    The primary flag is only set when a VM has several NICs; a single NIC is
+    primary implicitly.
+    
+    Args:
+        vm (Any): Virtual machine model
+        
+    Returns:
+        str: Resource ID of the primary NIC
+    """
+    nic_refs = vm.network_profile.network_interfaces
+    return next((nic_ref.id for nic_ref in nic_refs if nic_ref.primary), nic_refs[0].id)
+
+def allows_rdp_from_anywhere(rule: Any) -> bool:
+    """
+    Check whether an inbound allow rule admits RDP from any client without restriction
+    
+    This is the shape of the AllowRDP rule the bot manages: TCP (or any protocol),
+    any source address and port, any destination. Allow rules restricted to a
+    protocol, source or destination still need fixing.
+    
+    Args:
+        rule (Any): NSG security rule model that targets the RDP port
+        
+    Returns:
+        bool: True if the rule admits RDP from any client
+    """
+    def values(single: str, plural: str) -> set:
+        # The API carries either a single value or a list, never both
+        return {getattr(rule, single, None), *(getattr(rule, plural, None) or ())}
+    
+    access = getattr(rule.access, 'value', rule.access)
+    direction = getattr(rule.direction, 'value', rule.direction)
+    protocol = getattr(rule.protocol, 'value', rule.protocol)
+    return (
+        access == 'Allow' and direction == 'Inbound' and protocol in ('Tcp', '*')
+        and bool(values('source_address_prefix', 'source_address_prefixes') & OPEN_SOURCE_PREFIXES)
+        and '*' in values('source_port_range', 'source_port_ranges')
+        and '*' in values('destination_address_prefix', 'destination_address_prefixes')
+    )
+
 class AzureRDPTroubleshooter:
     """
     Azure RDP Troubleshooting Agent
@@ -51,46 +374,117 @@ class AzureRDPTroubleshooter:
     and OpenAI API for intelligent problem diagnosis.
     """
     
-    def __init__(self, subscription_id: str):
+    def __init__(self, subscription_id: str, use_cache: bool = True):
         """
         Initialize the RDP troubleshooter with Azure and OpenAI clients
         
         Args:
             subscription_id (str): Azure subscription ID for resource access
+            use_cache (bool): Whether to read the on-disk model list and AI analysis caches
         """
+        # Azure SDK and OpenAI imports are deferred to here: they pull in hundreds
+        # of modules, which --help and early error paths in main() never need
+        from azure.core.pipeline.transport import RequestsTransport
+        from azure.identity import DefaultAzureCredential
+        from azure.mgmt.compute import ComputeManagementClient
+        from azure.mgmt.network import NetworkManagementClient
+        from azure.mgmt.resource import ResourceManagementClient
+        import openai
+        import requests
+
         self.subscription_id = subscription_id
+        self.use_cache = use_cache
         
         # Initialize Azure clients using DefaultAzureCredential for authentication
         # This supports multiple auth methods: Azure CLI, Managed Identity, Service Principal, etc.
         self.credential = DefaultAzureCredential()
-        self.compute_client = ComputeManagementClient(self.credential, subscription_id)
-        self.network_client = NetworkManagementClient(self.credential, subscription_id)
-        self.resource_client = ResourceManagementClient(self.credential, subscription_id)
+        
+        # Share one HTTP connection pool across all management clients so TLS
+        # connections to management.azure.com are reused instead of each client
+        # opening its own; each host's pool holds HTTP_POOL_MAXSIZE connections,
+        # more than the MAX_WORKERS concurrent reads below
+        self._http_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=HTTP_POOL_MAXSIZE)
+        self._http_session.mount('https://', adapter)
+        transport = RequestsTransport(session=self._http_session, session_owner=False)
+        
+        # Transient throttling (429) and 5xx responses are retried by the SDK
+        # pipeline with bounded backoff instead of failing the whole run
+        client_kwargs = {
+            'transport': transport,
+            'retry_status': ARM_RETRY_STATUS,
+            'retry_backoff_factor': ARM_RETRY_BACKOFF_FACTOR,
+        }
+        self.compute_client = ComputeManagementClient(self.credential, subscription_id, **client_kwargs)
+        self.network_client = NetworkManagementClient(self.credential, subscription_id, **client_kwargs)
+        self.resource_client = ResourceManagementClient(self.credential, subscription_id, **client_kwargs)
+
+        # Per-run cache of ARM objects so the VM, NIC and NSG are fetched once and
+        # shared by diagnosis and fixes: {cache key: (fetched at, object)}
+        self._arm_cache: Dict[str, tuple] = {}
+
+        # Thread pool for overlapping independent, I/O-bound ARM reads
+        self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
         
         # Initialize OpenAI client for AI-powered analysis
         openai_api_key = os.getenv('OPENAI_API_KEY')
         if not openai_api_key:
             raise ValueError("OPENAI_API_KEY environment variable is required")
         
-        self.openai_client = openai.OpenAI(api_key=openai_api_key)
+        self.openai_client = openai.OpenAI(api_key=openai_api_key, max_retries=OPENAI_MAX_RETRIES)
         
-        # Check available models and select the best one for analysis
-        self.available_models = self.check_available_models()
-        self.model = self.select_best_model()
+        # A model pinned via OPENAI_MODEL is used as-is, without listing models
+        pinned_model = os.getenv('OPENAI_MODEL')
+        if pinned_model:
+            self.available_models = [pinned_model]
+            self.model = pinned_model
+        else:
+            # Check available models and select the best one for analysis
+            self.available_models = self.check_available_models(openai_api_key)
+            self.model = self.select_best_model()
+    
+    def close(self) -> None:
+        """Release resources held by the troubleshooter (worker threads, HTTP connections)"""
+        self._executor.shutdown(wait=False)
+        for client in (self.compute_client, self.network_client, self.resource_client):
+            client.close()
+        self._http_session.close()
+        self.credential.close()
+    
+    def __enter__(self) -> 'AzureRDPTroubleshooter':
+        return self
     
-    def check_available_models(self) -> List[str]:
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+    
+    def check_available_models(self, api_key: str) -> List[str]:
         """
-        Check available OpenAI models via API
+        Check available OpenAI models, using the on-disk cache when it is fresh
+        
+        The model catalog changes rarely, so a cached list saves the /v1/models
+        round-trip on most runs. Model access differs between accounts, so the
+        cache is kept per API key (stored under a hash of the key, never the key).
+        
+        Args:
+            api_key (str): OpenAI API key the model list belongs to
         
         Returns:
             List[str]: List of available model IDs
         """
+        key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+        cache_path = os.path.join(CACHE_DIR, f'models-{key_hash}.json')
+        if self.use_cache:
+            cached_models = _load_cache(cache_path, MODELS_CACHE_TTL_SECONDS)
+            if cached_models is not None:
+                return cached_models
+        
         try:
             models = self.openai_client.models.list()
             available_models = [model.id for model in models.data]
+            _store_cache(cache_path, available_models)
             return available_models
         except Exception as e:
-            logger.warning(f"Could not fetch available models: {e}")
+            logger.warning("Could not fetch available models: %s", e)
             return []
     
     def select_best_model(self) -> str:
@@ -100,28 +494,99 @@ class AzureRDPTroubleshooter:
         Model selection priority:
         1. GPT-4o (most capable and reliable)
         2. GPT-4 Turbo (high performance with extended context)
-        3. GPT-4 (standard high-quality model)
-        4. GPT-3.5 Turbo (fast and efficient)
+        3. GPT-3.5 Turbo (fast and efficient)
+        
+        Base GPT-4 is not used: analyze_with_ai requests JSON mode, which it rejects.
         
         Returns:
             str: Selected model ID
         """
-        preferred_models = ["gpt-4o", "gpt-4-turbo", "gpt-4", "gpt-3.5-turbo"]
+        preferred_models = ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"]
         
-        # Try each preferred model in order
-        for model in preferred_models:
-            if model in self.available_models:
-                return model
+        # Take the first preferred model that is available; a set makes each
+        # membership test O(1) regardless of how many models the account lists
+        available = set(self.available_models)
+        model = next((model for model in preferred_models if model in available), None)
+        if model:
+            return model
         
         # Fallback to first available model if none of the preferred ones are available
         if self.available_models:
             fallback_model = self.available_models[0]
-            logger.warning(f"Using fallback model: {fallback_model}")
+            logger.warning("Using fallback model: %s", fallback_model)
             return fallback_model
         
-        # Ultimate fallback - use gpt-4 even if not confirmed available
-        logger.error("No OpenAI models available, using gpt-4 as fallback")
-        return "gpt-4"
+        # Ultimate fallback - use gpt-4o even if not confirmed available
+        logger.error("No OpenAI models available, using gpt-4o as fallback")
+        return "gpt-4o"
+    
+    def _get_cached(self, key: str, fetcher: Callable[[], Any]) -> Any:
+        """
+        Return an ARM object from the per-run cache, fetching it on miss or expiry
+        
+        Args:
+            key (str): Cache key identifying the resource
+            fetcher (Callable[[], Any]): Performs the ARM GET on a cache miss
+            
+        Returns:
+            Any: The cached or freshly fetched SDK model
+        """
+        now = time.monotonic()
+        entry = self._arm_cache.get(key)
+        if entry is not None and now - entry[0] < ARM_CACHE_TTL_SECONDS:
+            return entry[1]
+        
+        value = fetcher()
+        self._arm_cache[key] = (now, value)
+        return value
+    
+    def _invalidate(self, key: str) -> None:
+        """Drop a cache entry after the resource has been modified"""
+        self._arm_cache.pop(key, None)
+    
+    @staticmethod
+    def _vm_key(resource_group: str, vm_name: str) -> str:
+        # ARM resource names are case-insensitive
+        return f"vm:{resource_group}/{vm_name}".lower()
+    
+    @staticmethod
+    def _nsg_key(resource_group: str, nsg_name: str) -> str:
+        return f"nsg:{resource_group}/{nsg_name}".lower()
+    
+    def _get_vm(self, resource_group: str, vm_name: str) -> Any:
+        """
+        Get a VM model including its instance view, served from the per-run cache when possible
+        
+        $expand=instanceView returns the model and the runtime statuses (power state)
+        in a single ARM call.
+        """
+        return self._get_cached(
+            self._vm_key(resource_group, vm_name),
+            lambda: self.compute_client.virtual_machines.get(resource_group, vm_name, expand='instanceView')
+        )
+    
+    def _get_nic(self, resource_group: str, nic_name: str) -> Any:
+        """Get a network interface, served from the per-run cache when possible"""
+        return self._get_cached(
+            f"nic:{resource_group}/{nic_name}".lower(),
+            lambda: self.network_client.network_interfaces.get(resource_group, nic_name)
+        )
+    
+    def _get_subnet(self, subnet_id: str) -> Any:
+        """Get a subnet by resource ID, served from the per-run cache when possible"""
+        # .../virtualNetworks/<vnet>/subnets/<subnet>
+        parsed = parse_arm_id(subnet_id)
+        return self._get_cached(
+            f"subnet:{subnet_id}".lower(),
+            lambda: self.network_client.subnets.get(parsed['resource_group'], parsed['name'], parsed['child_name_1'])
+        )
+    
+    def _get_nsg(self, resource_group: str, nsg_name: str) -> Any:
+        """Get a Network Security Group, served from the per-run cache when possible"""
+        return self._get_cached(
+            self._nsg_key(resource_group, nsg_name),
+            lambda: self.network_client.network_security_groups.get(resource_group, nsg_name)
+        )
     
     def get_vm_status(self, resource_group: str, vm_name: str) -> Dict[str, Any]:
         """
@@ -135,9 +600,8 @@ class AzureRDPTroubleshooter:
             Dict[str, Any]: VM status information including power state, size, OS type, etc.
         """
         try:
-            # Get VM configuration and instance view for power state
-            vm = self.compute_client.virtual_machines.get(resource_group, vm_name)
-            instance_view = self.compute_client.virtual_machines.instance_view(resource_group, vm_name)
+            # Get VM configuration together with its instance view for power state
+            vm = self._get_vm(resource_group, vm_name)
             
             # Build comprehensive status dictionary
             status = {
@@ -145,21 +609,21 @@ class AzureRDPTroubleshooter:
                 'location': vm.location,
                 'vm_size': vm.hardware_profile.vm_size,
                 'os_type': str(vm.storage_profile.os_disk.os_type) if vm.storage_profile.os_disk.os_type else 'Unknown',
-                'power_state': 'Unknown',  # Will be updated from instance view
+                # Power state is reported in the instance view as "PowerState/running",
+                # "PowerState/deallocated", etc.; take the first such status
+                'power_state': next(
+                    (status_info.code.split('/', 1)[1]
+                     for status_info in vm.instance_view.statuses or []
+                     if status_info.code.startswith('PowerState/')),
+                    'Unknown'
+                ),
                 'provisioning_state': vm.provisioning_state,
                 'network_interfaces': [nic.id for nic in vm.network_profile.network_interfaces]
             }
             
-            # Extract power state from instance view statuses
-            # Power state is reported as "PowerState/running", "PowerState/deallocated", etc.
-            for status_info in instance_view.statuses:
-                if status_info.code.startswith('PowerState/'):
-                    status['power_state'] = status_info.code.split('/')[1]
-                    break
-            
             return status
         except Exception as e:
-            logger.error(f"Error getting VM status: {e}")
+            logger.error("Error getting VM status: %s", e)
             return {'error': str(e)}
     
     def check_nsg_rules(self, resource_group: str, vm_name: str) -> Dict[str, Any]:
@@ -167,7 +631,15 @@ class AzureRDPTroubleshooter:
         Check Network Security Group rules for RDP (port 3389) and analyze rule priorities
         
         This method examines all NSG rules affecting RDP traffic and detects conflicts
-        between allow and deny rules based on their priority values.
+        between allow and deny rules based on their priority values. NSGs attached to
+        the VM's NICs and to their subnets are both checked; each distinct NSG is
+        fetched and analyzed once, however many NICs or subnets share it.
+        
+        Inbound traffic passes the NSG of the NIC it arrives on and the NSG of that
+        NIC's subnet, so priorities are only compared within one NSG, and RDP is
+        judged on the primary NIC's path: it counts as allowed only if every NSG on
+        that path allows it, and as conflicting if any of them has a deny rule that
+        outranks its allow rule. NSGs of secondary NICs are reported but not judged.
         
         Args:
             resource_group (str): Azure resource group name
@@ -177,80 +649,224 @@ class AzureRDPTroubleshooter:
             Dict[str, Any]: NSG analysis including rules, priorities, and conflict detection
         """
         try:
-            vm = self.compute_client.virtual_machines.get(resource_group, vm_name)
+            vm = self._get_vm(resource_group, vm_name)
             
             # Initialize NSG analysis structure
             nsg_info = {
-                'rdp_allowed': False,      # Whether RDP is explicitly allowed
+                'rdp_allowed': False,      # Whether every NSG on the RDP path has an inbound RDP allow rule
                 'rules': [],               # List of all RDP-related rules
-                'rdp_conflict': False,     # Whether there's a priority conflict
-                'allow_priority': None,    # Highest priority (lowest number) allow rule
-                'deny_priority': None,     # Highest priority (lowest number) deny rule
-                'has_deny_rdp': False      # Whether any deny rules exist for RDP
+                'rdp_conflict': False,     # Whether a deny rule outranks the allow rule in an NSG on the path
+                'allow_priority': None,    # Best allow priority in the primary NIC's NSG (managed by the bot)
+                'deny_priority': None,     # Best deny priority in the primary NIC's NSG
+                'has_deny_rdp': False,     # Whether any NSG on the path has a deny rule for RDP
+                'rdp_open': False,         # Whether every NSG on the path admits RDP from any client
+                'nsg_count': 0,            # Number of NSGs on the RDP path (primary NIC and its subnet)
+                'nsgs': [],                # Per-NSG RDP analysis, including secondary NICs
+                'subnet_errors': []        # Subnets whose NSG could not be read
             }
             
-            # Iterate through all network interfaces attached to the VM
-            for nic_ref in vm.network_profile.network_interfaces:
-                nic_name = nic_ref.id.split('/')[-1]
-                nic = self.network_client.network_interfaces.get(resource_group, nic_name)
-                
-                # Check if the NIC has an associated NSG
-                if nic.network_security_group:
-                    nsg_name = nic.network_security_group.id.split('/')[-1]
-                    nsg = self.network_client.network_security_groups.get(resource_group, nsg_name)
-                    
-                    # Analyze each security rule in the NSG
-                    for rule in nsg.security_rules:
-                        # Check if this rule affects RDP port 3389
-                        destination_port_range = getattr(rule, 'destination_port_range', None)
-                        destination_port_ranges = getattr(rule, 'destination_port_ranges', None) or []
-                        has_rdp = (
-                            destination_port_range == '3389' or
-                            ('3389' in destination_port_ranges)
-                        )
+            # Fetch all NICs attached to the VM concurrently, then their distinct
+            # subnets, then every distinct NSG, instead of one ARM call after another
+            # NICs are read from the resource group in their ID, which may differ from the VM's
+            nic_ids = [nic_ref.id for nic_ref in vm.network_profile.network_interfaces]
+            primary_nic = primary_nic_id(vm).lower()
+            nics = list(self._executor.map(
+                lambda nic_id: self._get_nic(resource_group_name(nic_id), resource_name(nic_id)),
+                nic_ids
+            ))
+            subnet_ids = list({
+                ip_config.subnet.id.lower(): ip_config.subnet.id
+                for nic in nics for ip_config in nic.ip_configurations or []
+                if ip_config.subnet
+            }.values())
+            
+            # Subnets often live in a separate network resource group the caller may
+            # not be able to read; a failed subnet read is recorded and the NIC NSGs
+            # are still analyzed
+            def read_subnet(subnet_id: str) -> Any:
+                try:
+                    return self._get_subnet(subnet_id)
+                except Exception as e:
+                    logger.warning("Could not read subnet %s: %s", resource_name(subnet_id), e)
+                    nsg_info['subnet_errors'].append({'subnet': resource_name(subnet_id), 'error': str(e)})
+                    return None
+            subnets = dict(zip((subnet_id.lower() for subnet_id in subnet_ids),
+                               self._executor.map(read_subnet, subnet_ids)))
+            
+            # Dedupe by NSG resource ID (case-insensitive): NICs and subnets commonly
+            # share one NSG, which is then fetched and analyzed only once.
+            # {lowercased NSG ID: (NSG ID, levels it is attached at)}
+            nsg_refs: Dict[str, tuple] = {}
+            # Lowercased IDs of the NSGs RDP to the primary NIC passes through; the bot
+            # manages the AllowRDP rule on the primary NIC's own NSG only
+            path_nsg_ids = set()
+            managed_nsg_id = None
+            for nic_id, nic in zip(nic_ids, nics):
+                on_path = nic_id.lower() == primary_nic
+                if on_path and nic.network_security_group:
+                    managed_nsg_id = nic.network_security_group.id.lower()
+                nic_subnets = [
+                    subnets[ip_config.subnet.id.lower()]
+                    for ip_config in nic.ip_configurations or [] if ip_config.subnet
+                ]
+                for level, resource in [('nic', nic)] + [('subnet', subnet) for subnet in nic_subnets]:
+                    if resource and resource.network_security_group:
+                        nsg_id = resource.network_security_group.id
+                        nsg_refs.setdefault(nsg_id.lower(), (nsg_id, set()))[1].add(level)
+                        if on_path:
+                            path_nsg_ids.add(nsg_id.lower())
+            nsg_ids = [nsg_id for nsg_id, _ in nsg_refs.values()]
+            nsgs = list(self._executor.map(
+                lambda nsg_id: self._get_nsg(resource_group_name(nsg_id), resource_name(nsg_id)),
+                nsg_ids
+            ))
+            
+            # Analyze each security rule in every distinct NSG, keeping priorities per NSG
+            for nsg_id, nsg in zip(nsg_ids, nsgs):
+                nsg_summary = {
+                    'name': nsg.name,
+                    'attached_to': sorted(nsg_refs[nsg_id.lower()][1]),
+                    'managed': nsg_id.lower() == managed_nsg_id,
+                    'on_rdp_path': nsg_id.lower() in path_nsg_ids,
+                    'rdp_allowed': False,
+                    'allow_priority': None,
+                    'deny_priority': None,
+                    'rdp_conflict': False,
+                    'rdp_open': False
+                }
+                open_priority = None
+                for rule in nsg.security_rules or []:
+                    # Check if this rule affects RDP port 3389
+                    if is_rdp_rule(rule):
+                        # Normalize enum-like fields which may be strings in different SDK versions
+                        access = getattr(rule.access, 'value', rule.access)
+                        direction = getattr(rule.direction, 'value', rule.direction)
+                        protocol = getattr(rule.protocol, 'value', rule.protocol)
+
+                        # Add rule details to the analysis
+                        nsg_info['rules'].append({
+                            'nsg': nsg.name,
+                            'name': rule.name,
+                            'access': access,
+                            'direction': direction,
+                            'priority': getattr(rule, 'priority', None),
+                            'source': getattr(rule, 'source_address_prefix', None),
+                            'destination': getattr(rule, 'destination_address_prefix', None),
+                            'protocol': protocol
+                        })
+                        
+                        # Check if RDP is explicitly allowed
+                        if access == 'Allow' and direction == 'Inbound':
+                            nsg_summary['rdp_allowed'] = True
+
+                        # Track rule priorities to detect conflicts
+                        # Lower priority numbers = higher precedence in Azure NSG
+                        if access == 'Allow' and direction == 'Inbound' and getattr(rule, 'priority', None) is not None:
+                            if nsg_summary['allow_priority'] is None or rule.priority < nsg_summary['allow_priority']:
+                                nsg_summary['allow_priority'] = rule.priority
+                                
+                        if access == 'Deny' and direction == 'Inbound' and getattr(rule, 'priority', None) is not None:
+                            if nsg_summary['deny_priority'] is None or rule.priority < nsg_summary['deny_priority']:
+                                nsg_summary['deny_priority'] = rule.priority
                         
-                        if has_rdp:
-                            # Normalize enum-like fields which may be strings in different SDK versions
-                            access = getattr(rule.access, 'value', rule.access)
-                            direction = getattr(rule.direction, 'value', rule.direction)
-                            protocol = getattr(rule.protocol, 'value', rule.protocol)
-
-                            # Add rule details to the analysis
-                            nsg_info['rules'].append({
-                                'name': rule.name,
-                                'access': access,
-                                'direction': direction,
-                                'priority': getattr(rule, 'priority', None),
-                                'source': getattr(rule, 'source_address_prefix', None),
-                                'destination': getattr(rule, 'destination_address_prefix', None),
-                                'protocol': protocol
-                            })
-                            
-                            # Check if RDP is explicitly allowed
-                            if access == 'Allow' and direction == 'Inbound':
-                                nsg_info['rdp_allowed'] = True
-
-                            # Track rule priorities to detect conflicts
-                            # Lower priority numbers = higher precedence in Azure NSG
-                            if access == 'Allow' and direction == 'Inbound' and getattr(rule, 'priority', None) is not None:
-                                if nsg_info['allow_priority'] is None or rule.priority < nsg_info['allow_priority']:
-                                    nsg_info['allow_priority'] = rule.priority
-                                    
-                            if access == 'Deny' and direction == 'Inbound' and getattr(rule, 'priority', None) is not None:
-                                if nsg_info['deny_priority'] is None or rule.priority < nsg_info['deny_priority']:
-                                    nsg_info['deny_priority'] = rule.priority
-                                nsg_info['has_deny_rdp'] = True
-
-                    # Detect priority conflicts: deny rule with higher precedence than allow rule
-                    if nsg_info['allow_priority'] is not None and nsg_info['deny_priority'] is not None:
-                        if nsg_info['deny_priority'] < nsg_info['allow_priority']:
-                            nsg_info['rdp_conflict'] = True
+                        if allows_rdp_from_anywhere(rule) and getattr(rule, 'priority', None) is not None:
+                            if open_priority is None or rule.priority < open_priority:
+                                open_priority = rule.priority
+                
+                # Detect priority conflicts: deny rule with higher precedence than allow rule
+                allow_priority = nsg_summary['allow_priority']
+                deny_priority = nsg_summary['deny_priority']
+                nsg_summary['rdp_conflict'] = (
+                    allow_priority is not None and deny_priority is not None and deny_priority < allow_priority
+                )
+                nsg_summary['rdp_open'] = (
+                    open_priority is not None and (deny_priority is None or open_priority < deny_priority)
+                )
+                nsg_info['nsgs'].append(nsg_summary)
+                
+                if nsg_summary['managed']:
+                    nsg_info['allow_priority'] = allow_priority
+                    nsg_info['deny_priority'] = deny_priority
+            
+            # RDP to the primary NIC must pass every NSG on its path (NIC and subnet)
+            path_nsgs = [n for n in nsg_info['nsgs'] if n['on_rdp_path']]
+            nsg_info['nsg_count'] = len(path_nsgs)
+            nsg_info['rdp_allowed'] = bool(path_nsgs) and all(n['rdp_allowed'] for n in path_nsgs)
+            nsg_info['rdp_conflict'] = any(n['rdp_conflict'] for n in path_nsgs)
+            nsg_info['has_deny_rdp'] = any(n['deny_priority'] is not None for n in path_nsgs)
+            nsg_info['rdp_open'] = bool(path_nsgs) and all(n['rdp_open'] for n in path_nsgs)
             
             return nsg_info
         except Exception as e:
-            logger.error(f"Error checking NSG rules: {e}")
+            logger.error("Error checking NSG rules: %s", e)
             return {'error': str(e)}
     
+    def analyze_with_rules(self, vm_status: Dict, nsg_info: Dict) -> Optional[Dict[str, Any]]:
+        """
+        Diagnose the common RDP failure patterns deterministically, without calling OpenAI
+        
+        A stopped or deallocated VM, a missing inbound RDP allow rule, and a deny rule
+        that outranks the allow rule are fully determined by the collected data. When
+        any of them is found, this returns an analysis in the same shape as
+        analyze_with_ai so the AI call can be skipped.
+        
+        Args:
+            vm_status (Dict): VM status and configuration information
+            nsg_info (Dict): Network Security Group analysis results
+            
+        Returns:
+            Optional[Dict[str, Any]]: Rule-based analysis, or None if no rule matched
+        """
+        causes = []
+        fix_steps = []
+        prevention = []
+        
+        power_state = vm_status.get('power_state')
+        if power_state in ('deallocated', 'stopped'):
+            causes.append(f"VM is not running (power state: {power_state})")
+            fix_steps.append("Start the VM")
+            prevention.append("Use Azure Monitor alerts or auto-start schedules to catch unexpected VM shutdowns")
+        
+        # NSG rules can only be judged if the NSG scan itself succeeded and found at
+        # least one NSG on the RDP path; without any there is no default deny rule
+        # to blame. Each NSG on the primary NIC's path (its NIC and subnet NSG) is
+        # judged on its own rules, since RDP traffic must pass both
+        if 'error' not in nsg_info and nsg_info.get('nsg_count'):
+            path_nsgs = [nsg for nsg in nsg_info.get('nsgs', []) if nsg['on_rdp_path']]
+            for nsg in path_nsgs:
+                label = f"NSG {nsg['name']} ({'/'.join(nsg['attached_to'])})"
+                if nsg['rdp_conflict']:
+                    causes.append(
+                        f"In {label}, deny rule at priority {nsg['deny_priority']} outranks the RDP allow rule "
+                        f"at priority {nsg['allow_priority']}"
+                    )
+                    fix_steps.append(
+                        f"In {label}, give the AllowRDP rule a lower priority number than the deny rule, "
+                        "or remove the deny rule"
+                    )
+                elif not nsg['rdp_allowed']:
+                    if nsg['deny_priority'] is not None:
+                        causes.append(f"An inbound rule in {label} denies RDP (port 3389) and no rule allows it")
+                    else:
+                        causes.append(f"No inbound rule in {label} allows RDP (port 3389); its default deny rule blocks it")
+                    fix_steps.append(f"Add an inbound AllowRDP rule for TCP port 3389 to {label}")
+            if any(nsg['rdp_conflict'] for nsg in path_nsgs):
+                prevention.append("Review NSG rule priorities whenever deny rules are added")
+            if not all(nsg['rdp_allowed'] for nsg in path_nsgs):
+                prevention.append("Manage NSG rules for RDP through templates or Azure Policy")
+        
+        if not causes:
+            return None
+        
+        return {
+            "root_cause": ". ".join(causes),
+            "fix_steps": fix_steps,
+            "prevention": prevention,
+            "priority": "High",
+            "confidence": 0.9,
+            "source": "rules"
+        }
+    
     def analyze_with_ai(self, vm_status: Dict, nsg_info: Dict, additional_info: Dict = None) -> Dict[str, Any]:
         """
         Use OpenAI to analyze RDP connectivity issues and provide intelligent recommendations
@@ -267,45 +883,44 @@ class AzureRDPTroubleshooter:
             Dict[str, Any]: AI analysis with root cause, fix steps, and recommendations
         """
         try:
-            # Prepare comprehensive context for AI analysis
-            context = {
-                'vm_status': vm_status,
-                'nsg_info': nsg_info,
-                'additional_info': additional_info or {},
-                'timestamp': datetime.now().isoformat()
+            # Only the relevant diagnostic data is sent to the model; indentation
+            # and unused fields would just add prompt tokens
+            prompt_inputs = {
+                'vm_status': _compact_vm_status(vm_status),
+                'nsg_info': _compact_nsg_info(nsg_info),
+                'additional_info': additional_info or {}
             }
             
-            # Construct detailed prompt for AI analysis
-            prompt = f"""
-            You are an Azure RDP troubleshooting expert. Analyze the following VM and network configuration to diagnose RDP connectivity issues.
-            
-            VM Status: {json.dumps(vm_status, indent=2)}
-            Network Security Group Info: {json.dumps(nsg_info, indent=2)}
-            Additional Info: {json.dumps(additional_info or {}, indent=2)}
-            
-            Please provide:
-            1. Root cause analysis
-            2. Specific steps to fix the issue
-            3. Prevention recommendations
-            4. Priority level (High/Medium/Low)
-            
-            Format your response as JSON with the following structure:
-            {{
-                "root_cause": "Brief description of the issue",
-                "fix_steps": ["Step 1", "Step 2", "Step 3"],
-                "prevention": ["Recommendation 1", "Recommendation 2"],
-                "priority": "High/Medium/Low",
-                "confidence": 0.95
-            }}
-            """
+            # Identical prompt inputs to the same model get the same analysis, so
+            # serve repeat runs against an unchanged VM from the on-disk cache.
+            # Keying on the compact inputs rather than the raw dicts means fields
+            # the model never sees (VM name, location, NIC IDs) do not split the cache
+            cache_key = hashlib.sha256(json.dumps(
+                {'model': self.model, **prompt_inputs},
+                sort_keys=True, separators=(',', ':'), default=str
+            ).encode('utf-8')).hexdigest()
+            cache_path = os.path.join(CACHE_DIR, 'ai', f'{cache_key}.json')
+            if self.use_cache:
+                cached_analysis = _load_cache(cache_path, AI_CACHE_TTL_SECONDS)
+                if cached_analysis is not None:
+                    logger.info("Using cached AI analysis")
+                    return cached_analysis
+            
+            # Fill the module-level prompt template with compact JSON of the inputs
+            prompt = AI_ANALYSIS_PROMPT.format(**{
+                key: json.dumps(value, separators=(',', ':'), default=str)
+                for key, value in prompt_inputs.items()
+            })
             
             # Send request to OpenAI API
             response = self.openai_client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "You are an expert Azure RDP troubleshooting specialist. Provide clear, actionable recommendations in JSON format."},
+                    {"role": "system", "content": AI_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
+                # JSON mode guarantees the reply is a parseable JSON object
+                response_format={"type": "json_object"},
                 max_completion_tokens=1000
             )
             
@@ -324,37 +939,13 @@ class AzureRDPTroubleshooter:
                     "raw_response": ai_response
                 }
             
+            # JSON mode returns a bare JSON object, so no markdown fences to strip.
+            # A reply cut off at max_completion_tokens is still unparseable, so keep
+            # the raw text for inspection
             try:
-                # Clean the response - remove markdown code blocks if present
-                # Some models return JSON wrapped in ```json ... ``` blocks
-                cleaned_response = ai_response.strip()
-                if cleaned_response.startswith('```json'):
-                    cleaned_response = cleaned_response[7:]  # Remove ```json
-                if cleaned_response.startswith('```'):
-                    cleaned_response = cleaned_response[3:]   # Remove ```
-                if cleaned_response.endswith('```'):
-                    cleaned_response = cleaned_response[:-3]  # Remove trailing ```
-                cleaned_response = cleaned_response.strip()
-                
-                # Parse JSON response
-                parsed_response = json.loads(cleaned_response)
-                
-                # Validate that the response has the expected structure
-                required_fields = ["root_cause", "fix_steps", "prevention", "priority", "confidence"]
-                if all(field in parsed_response for field in required_fields):
-                    return parsed_response
-                else:
-                    logger.warning(f"AI response missing required fields. Got: {list(parsed_response.keys())}")
-                    return {
-                        "root_cause": "AI response missing required fields",
-                        "fix_steps": ["Check the AI response manually"],
-                        "prevention": ["Review AI response format"],
-                        "priority": "Medium",
-                        "confidence": 0.0,
-                        "raw_response": ai_response
-                    }
+                parsed_response = json.loads(ai_response)
             except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse AI response as JSON: {e}")
+                logger.warning("Failed to parse AI response as JSON: %s", e)
                 return {
                     "root_cause": "Unable to parse AI response as JSON",
                     "fix_steps": ["Check the AI response manually"],
@@ -363,9 +954,25 @@ class AzureRDPTroubleshooter:
                     "confidence": 0.0,
                     "raw_response": ai_response
                 }
+            
+            # JSON mode does not enforce the schema; validate the expected structure
+            required_fields = ["root_cause", "fix_steps", "prevention", "priority", "confidence"]
+            if all(field in parsed_response for field in required_fields):
+                _store_cache(cache_path, parsed_response)
+                return parsed_response
+            else:
+                logger.warning("AI response missing required fields. Got: %s", list(parsed_response.keys()))
+                return {
+                    "root_cause": "AI response missing required fields",
+                    "fix_steps": ["Check the AI response manually"],
+                    "prevention": ["Review AI response format"],
+                    "priority": "Medium",
+                    "confidence": 0.0,
+                    "raw_response": ai_response
+                }
                 
         except Exception as e:
-            logger.error(f"Error in AI analysis: {e}")
+            logger.error("Error in AI analysis: %s", e)
             return {
                 "root_cause": f"AI analysis failed: {str(e)}",
                 "fix_steps": ["Check logs for detailed error information"],
@@ -389,16 +996,18 @@ class AzureRDPTroubleshooter:
             Dict[str, Any]: Result of the VM start operation
         """
         try:
-            logger.info(f"Starting VM: {vm_name}")
+            logger.info("Starting VM: %s", vm_name)
             
             # Begin asynchronous VM start operation
             async_vm_start = self.compute_client.virtual_machines.begin_start(
                 resource_group_name=resource_group,
-                vm_name=vm_name
+                vm_name=vm_name,
+                polling_interval=LRO_POLLING_INTERVAL
             )
             
             # Wait for the operation to complete
             async_vm_start.wait()
+            self._invalidate(self._vm_key(resource_group, vm_name))
             
             return {
                 'status': 'success',
@@ -406,7 +1015,7 @@ class AzureRDPTroubleshooter:
                 'message': f'VM {vm_name} started successfully'
             }
         except Exception as e:
-            logger.error(f"Error starting VM: {e}")
+            logger.error("Error starting VM: %s", e)
             return {
                 'status': 'error',
                 'action': 'vm_start_failed',
@@ -430,40 +1039,30 @@ class AzureRDPTroubleshooter:
         """
         try:
             # Get VM to find the associated network interface and NSG
-            vm = self.compute_client.virtual_machines.get(
-                resource_group_name=resource_group,
-                vm_name=vm_name
-            )
+            vm = self._get_vm(resource_group, vm_name)
             
             # Get the primary network interface
-            nic_id = vm.network_profile.network_interfaces[0].id
-            nic_name = nic_id.split('/')[-1]
-            
-            nic = self.network_client.network_interfaces.get(
-                resource_group_name=resource_group,
-                network_interface_name=nic_name
-            )
+            nic_id = primary_nic_id(vm)
+            nic = self._get_nic(resource_group_name(nic_id), resource_name(nic_id))
             
-            # Get the Network Security Group
+            # Get the Network Security Group; it may live in another resource group
             nsg_id = nic.network_security_group.id
-            nsg_name = nsg_id.split('/')[-1]
+            nsg_resource_group = resource_group_name(nsg_id)
+            nsg_name = resource_name(nsg_id)
             
-            logger.info(f"Ensuring RDP allow rule on NSG: {nsg_name}")
+            logger.info("Ensuring RDP allow rule on NSG: %s", nsg_name)
 
             # Determine target priority - default to 500 if not specified
             target_priority = desired_priority if desired_priority is not None else 500
 
             # Analyze existing NSG rules to detect conflicts and existing allow rules
-            nsg = self.network_client.network_security_groups.get(resource_group, nsg_name)
+            nsg = self._get_nsg(nsg_resource_group, nsg_name)
             existing_allow = None
             highest_precedence_deny = None
             
             for rule in nsg.security_rules or []:
                 # Check if this rule affects RDP port 3389
-                destination_port_range = getattr(rule, 'destination_port_range', None)
-                destination_port_ranges = getattr(rule, 'destination_port_ranges', None) or []
-                has_rdp = (destination_port_range == '3389' or ('3389' in destination_port_ranges))
-                if not has_rdp:
+                if not is_rdp_rule(rule):
                     continue
                     
                 access = getattr(rule.access, 'value', rule.access)
@@ -490,54 +1089,48 @@ class AzureRDPTroubleshooter:
                 # Ensure we don't go below the minimum priority of 100
                 if target_priority < 100:
                     # If we can't go lower than 100, we need to delete the deny rule instead
-                    logger.warning(f"Cannot set priority lower than 100 to outrank deny rule at priority {deny_pri}")
+                    logger.warning("Cannot set priority lower than 100 to outrank deny rule at priority %s", deny_pri)
                     # For now, we'll try to delete the deny rule
                     try:
                         self.network_client.security_rules.begin_delete(
-                            resource_group_name=resource_group,
+                            resource_group_name=nsg_resource_group,
                             network_security_group_name=nsg_name,
-                            security_rule_name=highest_precedence_deny.name
+                            security_rule_name=highest_precedence_deny.name,
+                            polling_interval=LRO_POLLING_INTERVAL
                         ).wait()
-                        logger.info(f"Deleted conflicting deny rule: {highest_precedence_deny.name}")
+                        self._invalidate(self._nsg_key(nsg_resource_group, nsg_name))
+                        logger.info("Deleted conflicting deny rule: %s", highest_precedence_deny.name)
                         # Reset target priority to default since we removed the conflict
                         target_priority = 500
                     except Exception as e:
-                        logger.error(f"Failed to delete deny rule: {e}")
+                        logger.error("Failed to delete deny rule: %s", e)
                         # Fall back to trying priority 100 (will likely fail)
                         target_priority = 100
-                logger.info(f"Adjusted target priority to {target_priority} to outrank deny rule at priority {deny_pri}")
-
-            # Build the RDP allow rule configuration
-            rdp_rule = {
-                'name': 'AllowRDP',
-                'priority': target_priority,
-                'direction': 'Inbound',
-                'access': 'Allow',
-                'protocol': 'Tcp',
-                'source_port_range': '*',
-                'destination_port_range': '3389',
-                'source_address_prefix': '*',
-                'destination_address_prefix': '*',
-                'description': 'Allow RDP access - Managed by Enable RDP Bot'
-            }
+                logger.info("Adjusted target priority to %s to outrank deny rule at priority %s", target_priority, deny_pri)
+
+            # Build the RDP allow rule configuration from the shared template
+            rdp_rule = {**RDP_ALLOW_RULE_TEMPLATE, 'priority': target_priority}
 
             # Handle priority conflicts by deleting and recreating the rule
             # Azure doesn't allow updating a rule to have the same priority as an existing rule
             if existing_allow is not None and existing_allow.priority != target_priority:
-                logger.info(f"Deleting existing AllowRDP rule with priority {existing_allow.priority} to resolve conflict")
+                logger.info("Deleting existing AllowRDP rule with priority %s to resolve conflict", existing_allow.priority)
                 self.network_client.security_rules.begin_delete(
-                    resource_group_name=resource_group,
+                    resource_group_name=nsg_resource_group,
                     network_security_group_name=nsg_name,
-                    security_rule_name='AllowRDP'
+                    security_rule_name='AllowRDP',
+                    polling_interval=LRO_POLLING_INTERVAL
                 ).wait()
 
             # Create or update the AllowRDP rule
             self.network_client.security_rules.begin_create_or_update(
-                resource_group_name=resource_group,
+                resource_group_name=nsg_resource_group,
                 network_security_group_name=nsg_name,
                 security_rule_name='AllowRDP',
-                security_rule_parameters=rdp_rule
+                security_rule_parameters=rdp_rule,
+                polling_interval=LRO_POLLING_INTERVAL
             ).wait()
+            self._invalidate(self._nsg_key(nsg_resource_group, nsg_name))
 
             # Determine the action taken
             action = 'nsg_rule_added' if existing_allow is None else 'nsg_rule_updated'
@@ -549,14 +1142,14 @@ class AzureRDPTroubleshooter:
             }
             
         except Exception as e:
-            logger.error(f"Error adding NSG rule: {e}")
+            logger.error("Error adding NSG rule: %s", e)
             return {
                 'status': 'error',
                 'action': 'nsg_rule_failed',
                 'message': f'Failed to add RDP rule: {str(e)}'
             }
     
-    def troubleshoot_rdp(self, resource_group: str, vm_name: str) -> Dict[str, Any]:
+    def troubleshoot_rdp(self, resource_group: str, vm_name: str, force_ai: bool = False) -> Dict[str, Any]:
         """
         Main troubleshooting workflow that diagnoses and auto-fixes RDP connectivity issues
         
@@ -570,11 +1163,12 @@ class AzureRDPTroubleshooter:
         Args:
             resource_group (str): Azure resource group name
             vm_name (str): Virtual machine name
+            force_ai (bool): Always use AI analysis, even when a deterministic rule matches
             
         Returns:
             Dict[str, Any]: Complete troubleshooting report with diagnosis and fixes applied
         """
-        logger.info(f"Starting RDP troubleshooting for VM: {vm_name} in resource group: {resource_group}")
+        logger.info("Starting RDP troubleshooting for VM: %s in resource group: %s", vm_name, resource_group)
         
         # Step 1: Get comprehensive VM status and configuration
         vm_status = self.get_vm_status(resource_group, vm_name)
@@ -589,27 +1183,71 @@ class AzureRDPTroubleshooter:
         # Step 2: Analyze Network Security Group rules for RDP access
         nsg_info = self.check_nsg_rules(resource_group, vm_name)
         
-        # Step 3: Use AI to analyze the collected data and provide recommendations
-        ai_analysis = self.analyze_with_ai(vm_status, nsg_info)
+        # Step 3: Diagnose known failure patterns with deterministic rules, and only
+        # fall back to AI analysis for configurations the rules don't explain.
+        # The fixes below don't depend on the analysis, so the AI call runs in the
+        # background while they are applied and is collected for the report
+        ai_analysis = None if force_ai else self.analyze_with_rules(vm_status, nsg_info)
+        ai_future = None
+        if ai_analysis is None:
+            ai_future = self._executor.submit(self.analyze_with_ai, vm_status, nsg_info)
         
         # Step 4: Auto-fix identified issues
         fixes_applied = []
         
         # Fix VM power state if the VM is stopped or deallocated
-        if vm_status.get('power_state') == 'deallocated':
+        if vm_status.get('power_state') in ('deallocated', 'stopped'):
             logger.info("VM is stopped - attempting to start it")
             vm_fix_result = self.fix_vm_power_state(resource_group, vm_name)
             fixes_applied.append(vm_fix_result)
         
-        # Ensure NSG allows RDP access with proper priority
-        # If deny rules exist, ensure allow rule has higher precedence (lower priority number)
-        logger.info("Verifying NSG RDP allow rule priority and presence")
-        desired_priority = None
-        if nsg_info.get('deny_priority') is not None:
-            # Set allow rule priority to be higher precedence than deny rule
-            desired_priority = max(100, nsg_info['deny_priority'] - 1)
-        nsg_fix_result = self.fix_nsg_rdp_rule(resource_group, vm_name, desired_priority)
-        fixes_applied.append(nsg_fix_result)
+        # Ensure NSG allows RDP access with proper priority, unless every NSG already
+        # admits RDP from any client; restricted allow rules (protocol, source,
+        # destination) still go through the fix
+        if 'error' in nsg_info:
+            # The NSG scan failed, so let the fix inspect the primary NIC's NSG itself
+            fixes_applied.append(self.fix_nsg_rdp_rule(resource_group, vm_name))
+        elif nsg_info.get('rdp_open'):
+            logger.info("NSG already allows RDP from any source - no change needed")
+            fixes_applied.append({
+                'status': 'skipped',
+                'action': 'nsg_rule_unchanged',
+                'message': 'NSG already allows inbound RDP from any source'
+            })
+        elif not nsg_info.get('nsg_count'):
+            fixes_applied.append({
+                'status': 'skipped',
+                'action': 'nsg_rule_unchanged',
+                'message': "No NSG is attached to the VM's primary network interface or its subnet"
+            })
+        else:
+            # Only NSGs on the primary NIC's RDP path matter. The primary NIC's own NSG
+            # is changed automatically; a closed subnet NSG on the path is reported
+            # for manual action instead
+            for nsg in nsg_info['nsgs']:
+                if nsg['rdp_open'] or not nsg['on_rdp_path']:
+                    continue
+                if nsg['managed']:
+                    # If deny rules exist, ensure allow rule has higher precedence (lower priority number)
+                    logger.info("Verifying NSG RDP allow rule priority and presence")
+                    desired_priority = None
+                    if nsg['deny_priority'] is not None:
+                        # Set allow rule priority to be higher precedence than deny rule
+                        desired_priority = max(100, nsg['deny_priority'] - 1)
+                    fixes_applied.append(self.fix_nsg_rdp_rule(resource_group, vm_name, desired_priority))
+                else:
+                    logger.warning("NSG %s does not allow RDP and is not managed by the bot", nsg['name'])
+                    fixes_applied.append({
+                        'status': 'manual_action_required',
+                        'action': 'nsg_rule_not_managed',
+                        'message': (
+                            f"NSG {nsg['name']} ({'/'.join(nsg['attached_to'])}) does not allow inbound RDP "
+                            "from any source; only the primary network interface's NSG is changed automatically"
+                        )
+                    })
+        
+        if ai_future is not None:
+            ai_analysis = ai_future.result()
         
         # Step 5: Generate comprehensive troubleshooting report
         report = {
@@ -638,38 +1276,55 @@ def main():
         epilog="""
 Example:
   python enable_rdp_bot.py --rg production-rg --vm web-server-01
+
+Environment:
+  OPENAI_API_KEY         OpenAI API key (required)
+  OPENAI_MODEL           Model to use; skips model discovery when set
+  AZURE_SUBSCRIPTION_ID  Subscription to use; defaults to the Azure CLI's
+                         default subscription ('az account set')
         """
     )
     
     # Define command-line arguments
     parser.add_argument('--rg', required=True, help='Azure resource group name')
     parser.add_argument('--vm', '-v', required=True, help='Virtual machine name')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignore cached OpenAI model lists and AI analyses and query OpenAI again')
+    parser.add_argument('--debug-http', action='store_true',
+                        help='Log every Azure and OpenAI HTTP request and response')
+    parser.add_argument('--force-ai', action='store_true',
+                        help='Always run the AI analysis, even for issues the built-in rules diagnose')
     
     args = parser.parse_args()
     
-    # Get Azure subscription ID from Azure CLI
-    # This requires the user to be logged in with 'az login'
-    try:
-        import subprocess
-        result = subprocess.run(['az', 'account', 'show', '--query', 'id', '-o', 'tsv'], 
-                              capture_output=True, text=True, check=True)
-        subscription_id = result.stdout.strip()
-    except:
-        logger.error("Could not determine Azure subscription ID. Please ensure you are logged in with 'az login'")
+    if args.debug_http:
+        for name in HTTP_LOGGERS:
+            logging.getLogger(name).setLevel(logging.DEBUG)
+    
+    # Load environment variables from .env; deferred past argument parsing so
+    # --help and usage errors do not pay for it
+    from dotenv import load_dotenv
+    load_dotenv()
+    
+    # Get Azure subscription ID from the environment or the Azure CLI profile
+    subscription_id = get_subscription_id()
+    if not subscription_id:
+        logger.error("Could not determine Azure subscription ID. Set AZURE_SUBSCRIPTION_ID or log in with 'az login'")
         sys.exit(1)
     
     try:
         # Initialize the RDP troubleshooter with Azure and OpenAI clients
-        troubleshooter = AzureRDPTroubleshooter(subscription_id)
-        
-        # Execute the complete RDP troubleshooting workflow
-        result = troubleshooter.troubleshoot_rdp(args.rg, args.vm)
+        with AzureRDPTroubleshooter(subscription_id, use_cache=not args.no_cache) as troubleshooter:
+            # Execute the complete RDP troubleshooting workflow
+            result = troubleshooter.troubleshoot_rdp(args.rg, args.vm, force_ai=args.force_ai)
         
-        # Output the results as formatted JSON
-        print(json.dumps(result, indent=2))
+        # Output the results as formatted JSON, encoded straight to stdout rather
+        # than built as one string first
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write('\n')
             
     except Exception as e:
-        logger.error(f"Error: {e}")
+        logger.error("Error: %s", e)
         sys.exit(1)
 
 if __name__ == '__main__':
@@ -0,0 +1,268 @@
+"""
+Tests for the NSG analysis and NSG auto-fix decisions in enable_rdp_bot
+
+The Azure SDK clients are replaced by in-memory fakes, so these tests run
+without Azure credentials or the azure-* packages installed.
+"""
+
+import os
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import enable_rdp_bot  # noqa: E402
+
+SUBSCRIPTION = '/subscriptions/00000000-0000-0000-0000-000000000000'
+
+
+def _parse_arm_id(resource_id):
+    # Stand-in for azure.mgmt.core.tools.parse_resource_id covering the IDs used here
+    parts = resource_id.split('/')
+    parsed = {'resource_group': parts[4], 'name': parts[8], 'resource_name': parts[-1]}
+    if len(parts) > 10:
+        parsed['child_name_1'] = parts[10]
+    return parsed
+
+
+def _network_id(resource_group, resource_type, name):
+    return f"{SUBSCRIPTION}/resourceGroups/{resource_group}/providers/Microsoft.Network/{resource_type}/{name}"
+
+
+def _rdp_rule(name, access, priority, **overrides):
+    rule = {
+        'name': name,
+        'access': access,
+        'direction': 'Inbound',
+        'protocol': 'Tcp',
+        'priority': priority,
+        'source_address_prefix': '*',
+        'source_port_range': '*',
+        'destination_address_prefix': '*',
+        'destination_port_range': '3389',
+        'destination_port_ranges': None,
+    }
+    rule.update(overrides)
+    return SimpleNamespace(**rule)
+
+
+class FakeNetwork:
+    """
+    In-memory VM, NIC, subnet and NSG topology behind fake SDK clients
+
+    nics maps NIC name -> (NSG name or None, subnet name, primary flag);
+    subnets maps subnet name -> NSG name or None; nsgs maps NSG name -> rules.
+    """
+
+    def __init__(self, nics, subnets, nsgs, unreadable_subnets=()):
+        self.nics = nics
+        self.subnets = subnets
+        self.nsgs = nsgs
+        self.unreadable_subnets = set(unreadable_subnets)
+
+    def _ref(self, resource_type, name):
+        return SimpleNamespace(id=_network_id('rg', resource_type, name)) if name else None
+
+    def get_vm(self, resource_group, vm_name, expand=None):
+        nic_refs = [
+            SimpleNamespace(id=_network_id('rg', 'networkInterfaces', name), primary=primary)
+            for name, (_, _, primary) in self.nics.items()
+        ]
+        return SimpleNamespace(
+            name=vm_name,
+            location='eastus',
+            hardware_profile=SimpleNamespace(vm_size='Standard_B1s'),
+            storage_profile=SimpleNamespace(os_disk=SimpleNamespace(os_type='Windows')),
+            provisioning_state='Succeeded',
+            instance_view=SimpleNamespace(statuses=[SimpleNamespace(code='PowerState/running')]),
+            network_profile=SimpleNamespace(network_interfaces=nic_refs)
+        )
+
+    def get_nic(self, resource_group, nic_name):
+        nsg_name, subnet_name, _ = self.nics[nic_name]
+        subnet_id = _network_id('netrg', 'virtualNetworks', f'vnet/subnets/{subnet_name}')
+        return SimpleNamespace(
+            network_security_group=self._ref('networkSecurityGroups', nsg_name),
+            ip_configurations=[SimpleNamespace(subnet=SimpleNamespace(id=subnet_id))]
+        )
+
+    def get_subnet(self, resource_group, vnet_name, subnet_name):
+        if subnet_name in self.unreadable_subnets:
+            raise RuntimeError('(AuthorizationFailed) 403 Forbidden')
+        return SimpleNamespace(network_security_group=self._ref('networkSecurityGroups', self.subnets[subnet_name]))
+
+    def get_nsg(self, resource_group, nsg_name):
+        return SimpleNamespace(name=nsg_name, security_rules=self.nsgs[nsg_name])
+
+    def troubleshooter(self):
+        troubleshooter = object.__new__(enable_rdp_bot.AzureRDPTroubleshooter)
+        troubleshooter._arm_cache = {}
+        troubleshooter._executor = ThreadPoolExecutor(max_workers=4)
+        troubleshooter.compute_client = SimpleNamespace(virtual_machines=SimpleNamespace(get=self.get_vm))
+        troubleshooter.network_client = SimpleNamespace(
+            network_interfaces=SimpleNamespace(get=self.get_nic),
+            subnets=SimpleNamespace(get=self.get_subnet),
+            network_security_groups=SimpleNamespace(get=self.get_nsg)
+        )
+        return troubleshooter
+
+
+class NetworkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(enable_rdp_bot, 'parse_arm_id', _parse_arm_id)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class CheckNsgRulesTest(NetworkTestCase):
+
+    def analyze(self, network):
+        troubleshooter = network.troubleshooter()
+        self.addCleanup(troubleshooter._executor.shutdown)
+        nsg_info = troubleshooter.check_nsg_rules('rg', 'vm')
+        return nsg_info, troubleshooter.analyze_with_rules({'power_state': 'running'}, nsg_info)
+
+    def test_multi_nic_vm_is_judged_on_the_primary_nic_path(self):
+        network = FakeNetwork(
+            nics={'data-nic': ('data', 'data-subnet', False), 'main-nic': ('main', 'default', True)},
+            subnets={'default': None, 'data-subnet': None},
+            nsgs={
+                'main': [_rdp_rule('AllowRDP', 'Allow', 300)],
+                'data': [_rdp_rule('DenyRDP', 'Deny', 200)],
+            }
+        )
+        nsg_info, analysis = self.analyze(network)
+
+        self.assertTrue(nsg_info['rdp_allowed'])
+        self.assertTrue(nsg_info['rdp_open'])
+        self.assertFalse(nsg_info['has_deny_rdp'])
+        self.assertEqual(nsg_info['nsg_count'], 1)
+        self.assertEqual(
+            {nsg['name']: nsg['on_rdp_path'] for nsg in nsg_info['nsgs']},
+            {'main': True, 'data': False}
+        )
+        self.assertIsNone(analysis)
+
+    def test_subnet_nsg_on_the_path_is_judged_separately(self):
+        network = FakeNetwork(
+            nics={'nic': ('nic-nsg', 'default', None)},
+            subnets={'default': 'subnet-nsg'},
+            nsgs={
+                'nic-nsg': [_rdp_rule('AllowRDP', 'Allow', 500)],
+                'subnet-nsg': [_rdp_rule('DenyRDP', 'Deny', 300)],
+            }
+        )
+        nsg_info, analysis = self.analyze(network)
+
+        self.assertFalse(nsg_info['rdp_allowed'])
+        self.assertFalse(nsg_info['rdp_conflict'])
+        # Priorities come from the NIC's own NSG, never from the subnet NSG
+        self.assertEqual(nsg_info['allow_priority'], 500)
+        self.assertIsNone(nsg_info['deny_priority'])
+        self.assertIn('subnet-nsg (subnet)', analysis['root_cause'])
+        self.assertNotIn('nic-nsg', analysis['root_cause'])
+
+    def test_unreadable_subnet_keeps_nic_analysis(self):
+        network = FakeNetwork(
+            nics={'nic': ('nic-nsg', 'default', None)},
+            subnets={'default': 'subnet-nsg'},
+            nsgs={'nic-nsg': [_rdp_rule('AllowRDP', 'Allow', 500)]},
+            unreadable_subnets={'default'}
+        )
+        nsg_info, _ = self.analyze(network)
+
+        self.assertNotIn('error', nsg_info)
+        self.assertEqual([error['subnet'] for error in nsg_info['subnet_errors']], ['default'])
+        self.assertTrue(nsg_info['rdp_allowed'])
+
+    def test_no_nsg_is_not_blamed_on_a_default_deny(self):
+        network = FakeNetwork(nics={'nic': (None, 'default', None)}, subnets={'default': None}, nsgs={})
+        nsg_info, analysis = self.analyze(network)
+
+        self.assertEqual(nsg_info['nsg_count'], 0)
+        self.assertIsNone(analysis)
+
+    def test_ai_prompt_keeps_only_the_rdp_path(self):
+        network = FakeNetwork(
+            nics={'main-nic': ('main', 'default', True), 'data-nic': ('data', 'data-subnet', False)},
+            subnets={'default': None, 'data-subnet': None},
+            nsgs={
+                'main': [_rdp_rule('AllowRDP', 'Allow', 300), _rdp_rule('OutRDP', 'Allow', 310, direction='Outbound')],
+                'data': [_rdp_rule('DenyRDP', 'Deny', 200)],
+            }
+        )
+        nsg_info, _ = self.analyze(network)
+
+        self.assertEqual(enable_rdp_bot._compact_nsg_info(nsg_info), {
+            'rdp_allowed': True,
+            'rdp_conflict': False,
+            'rdp_open': True,
+            'has_deny_rdp': False,
+            'nsgs': [{'name': 'main', 'attached_to': ['nic'], 'rdp_allowed': True,
+                      'rdp_conflict': False, 'rdp_open': True}],
+            'rules': [{'nsg': 'main', 'name': 'AllowRDP', 'access': 'Allow', 'priority': 300,
+                       'protocol': 'Tcp', 'source': '*'}],
+        })
+
+
+class TroubleshootNsgFixTest(NetworkTestCase):
+
+    def troubleshoot(self, network):
+        troubleshooter = network.troubleshooter()
+        self.addCleanup(troubleshooter._executor.shutdown)
+        troubleshooter.fix_nsg_rdp_rule = mock.Mock(return_value={'status': 'success', 'action': 'nsg_rule_added'})
+        troubleshooter.analyze_with_ai = mock.Mock(return_value={'root_cause': 'AI analysis'})
+        return troubleshooter, troubleshooter.troubleshoot_rdp('rg', 'vm')
+
+    def test_closed_secondary_nic_nsg_is_ignored_when_primary_path_is_open(self):
+        network = FakeNetwork(
+            nics={'main-nic': ('main', 'default', True), 'data-nic': ('data', 'data-subnet', False)},
+            subnets={'default': None, 'data-subnet': None},
+            nsgs={
+                'main': [_rdp_rule('AllowRDP', 'Allow', 300)],
+                'data': [_rdp_rule('DenyRDP', 'Deny', 200)],
+            }
+        )
+        troubleshooter, report = self.troubleshoot(network)
+
+        troubleshooter.fix_nsg_rdp_rule.assert_not_called()
+        self.assertEqual([fix['action'] for fix in report['fixes_applied']], ['nsg_rule_unchanged'])
+
+    def test_closed_subnet_nsg_on_the_path_is_reported_not_fixed(self):
+        network = FakeNetwork(
+            nics={'nic': ('nic-nsg', 'default', None)},
+            subnets={'default': 'subnet-nsg'},
+            nsgs={
+                'nic-nsg': [_rdp_rule('AllowRDP', 'Allow', 500)],
+                'subnet-nsg': [_rdp_rule('DenyRDP', 'Deny', 300)],
+            }
+        )
+        troubleshooter, report = self.troubleshoot(network)
+
+        troubleshooter.fix_nsg_rdp_rule.assert_not_called()
+        self.assertEqual(
+            [(fix['status'], fix['action']) for fix in report['fixes_applied']],
+            [('manual_action_required', 'nsg_rule_not_managed')]
+        )
+        self.assertIn('subnet-nsg', report['fixes_applied'][0]['message'])
+
+    def test_closed_primary_nic_nsg_is_fixed_with_its_own_deny_priority(self):
+        network = FakeNetwork(
+            nics={'main-nic': ('main', 'default', True), 'data-nic': ('data', 'default', False)},
+            subnets={'default': None},
+            nsgs={
+                'main': [_rdp_rule('DenyRDP', 'Deny', 400)],
+                'data': [_rdp_rule('DenyRDP', 'Deny', 150)],
+            }
+        )
+        troubleshooter, _ = self.troubleshoot(network)
+
+        troubleshooter.fix_nsg_rdp_rule.assert_called_once_with('rg', 'vm', 399)
+
+
+if __name__ == '__main__':
+    unittest.main()